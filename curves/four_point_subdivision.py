@@ -7,7 +7,15 @@ alongside the original four control points.
 Since each window of four control points can only generate one new point, the process has to be run
 repeatedly to create a smooth curve.
 
+Every new point is a fixed linear combination of the old ones, so all levels together can also be
+written as a single sparse matrix. That matrix only depends on the number of control points, the
+number of iterations, and the weight, which makes it cheap to apply to many curves at once.
+
 """
+from functools import lru_cache
+
+from scipy import sparse
+
 import numpy as np
 
 
@@ -48,5 +56,91 @@ def four_point_subdivision(data, iterations=10, weight=.0625):
                 new_data.append(sub_data[idx_old])
                 idx_old = idx_old + 1
         data = np.vstack((data[:2], new_data, data[-2:]))
-        print(data)
     return data
+
+
+def four_point_level(num_points, weight=.0625, closed=False):
+    """Builds the sparse matrix for a single level of Four Point Subdivision.
+
+    For open curves, the matrix works on points that already have their first and last point
+    duplicated, just like four_point_subdivision, and keeps those duplicates in place. For closed
+    curves, the windows wrap around the end of the curve, so every old point gets a new point
+    after it.
+
+    :param num_points: Number of points before subdivision.
+    :param weight: Optional. Weight parameter.
+    :param closed: Optional. Whether the curve is a closed loop.
+    :return: Sparse matrix that maps the old points to the new points.
+    """
+    stencil = np.array([-weight, 0.5 + weight, 0.5 + weight, -weight])
+    if closed:
+        new = np.arange(num_points)
+        new_rows = 2 * new + 1
+        new_cols = (new[:, None] + np.arange(-1, 3)) % num_points
+        old_rows = 2 * new
+        old_cols = new
+        shape = (2 * num_points, num_points)
+    else:
+        new = np.arange(num_points - 3)
+        new_rows = 2 * new + 2
+        new_cols = new[:, None] + np.arange(0, 4)
+        # The two points at each end are copied over as they are.
+        old_cols = np.arange(num_points)
+        old_rows = np.clip(2 * old_cols - 1, 0, None)
+        old_rows[-1] = 2 * num_points - 4
+        shape = (2 * num_points - 3, num_points)
+    rows = np.concatenate((np.repeat(new_rows, 4), old_rows))
+    cols = np.concatenate((new_cols.ravel(), old_cols))
+    weights = np.concatenate((np.tile(stencil, len(new)), np.ones(len(old_cols))))
+    return sparse.csr_matrix((weights, (rows, cols)), shape=shape)
+
+
+@lru_cache(maxsize=32)
+def four_point_operator(num_points, iterations=10, weight=.0625, closed=False):
+    """Builds the composed sparse matrix for Four Point Subdivision.
+
+    The matrix maps the original control points directly to the points of the final curve. It is
+    cached, so curves that share the same number of points, iterations, and weight only build it
+    once. The returned matrix is shared between callers and should not be modified.
+
+    :param num_points: Number of control points.
+    :param iterations: Optional. Number of subdivision levels.
+    :param weight: Optional. Weight parameter.
+    :param closed: Optional. Whether the curve is a closed loop.
+    :return: Sparse matrix that maps the control points to the points on the curve.
+    """
+    if closed:
+        operator = sparse.identity(num_points, format='csr')
+    else:
+        # Duplicate first and last point, as four_point_subdivision does.
+        cols = np.concatenate(([0], np.arange(num_points), [num_points - 1]))
+        operator = sparse.csr_matrix((np.ones(len(cols)), (np.arange(len(cols)), cols)),
+                                     shape=(num_points + 2, num_points))
+    for _ in range(iterations):
+        operator = four_point_level(operator.shape[0], weight, closed) @ operator
+    return operator
+
+
+def four_point_subdivision_batch(polylines, iterations=10, weight=.0625, closed=False):
+    """Four Point Subdivision for many curves at once.
+
+    All curves need the same number of control points. The cached subdivision matrix is applied to
+    every curve in a single sparse product. Open curves give the same points as
+    four_point_subdivision. Closed curves wrap around, so the last control point connects back to
+    the first one.
+
+    :param polylines: List of curves. Each curve is a list of control points: [[x, y, ...], ...].
+    :param iterations: Optional. Number of subdivision levels.
+    :param weight: Optional. Weight parameter.
+    :param closed: Optional. Whether the curves are closed loops.
+    :return: Array of curves. Each curve is an array of points on that curve.
+    """
+    data = np.array(polylines, dtype='float32')
+    if data.ndim != 3 or data.shape[1] < 4:
+        return None
+    count, num_points, dims = data.shape
+    operator = four_point_operator(num_points, iterations, weight, closed)
+    # Stack the curves side by side so the product handles all of them at once.
+    points = data.transpose(1, 0, 2).reshape(num_points, count * dims)
+    points = (operator @ points).astype('float32')
+    return points.reshape(-1, count, dims).transpose(1, 0, 2)
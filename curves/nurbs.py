@@ -23,19 +23,20 @@ def join_points_and_weights(points, weights):
     """
     if not len(points) == len(weights):
         raise Exception('Invalid data provided. Length of points and weights does not match.')
-    new_points = np.zeros(len(points), len(points[0]))
+    new_points = np.zeros((len(points), len(points[0]) + 1))
     for i in range(0, len(points)):
         point = points[i]
         w = weights[i]
         new_points[i] = list(np.array(point) * w) + [w, ]
-    return points
+    return new_points
 
 
 def nurbs(degree, points, weights, t_values=None, knots=None):
     """NURBS curve algorithm.
 
     Combines points with their respective weights and runs them through the standard B-spline algorithm.
-    This function can be used to evaluate the curve at one or many points.
+    The results are divided by their weight to project them back onto the curve. This function can
+    be used to evaluate the curve at one or many points.
 
     :param degree: Degree of the NURBS curve. Usually set to 3.
     :param points: List of control points. Each point is also structured as a list: [x, y, ...].
@@ -47,4 +48,5 @@ def nurbs(degree, points, weights, t_values=None, knots=None):
     if t_values is None:
         t_values = np.linspace(0, len(points) - degree, len(points) * 1000)[:-1]
     data = join_points_and_weights(points, weights)
-    return [bspline(t, degree, data, knots) for t in t_values]
+    points = [bspline(t, degree, data, knots) for t in t_values]
+    return [point[:-1] / point[-1] for point in points]
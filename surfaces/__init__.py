@@ -0,0 +1 @@
+__all__ = ["catmull_clark", "halfedge", "loop"]
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Computes Catmull-Clark subdivision surfaces.
+
+Catmull-Clark subdivision works on meshes made of arbitrary polygons. Every level adds a point in
+the middle of each face and each edge, moves the original vertices, and splits every n-sided face
+into n quads. After the first level, the mesh consists only of quads. In the limit, the surface is
+a bicubic B-spline surface everywhere except around extraordinary vertices.
+
+Since the new points are linear combinations of the old vertices, each level is built as a sparse
+matrix that only depends on the connectivity of the mesh. Sharp edges follow the cubic B-spline
+curve rule instead, so boundaries and creases stay sharp. Refinement can also be limited to part of
+the mesh, so the face count only grows where the detail is needed.
+
+"""
+from scipy import sparse
+
+import numpy as np
+
+from surfaces.halfedge import subdivide
+
+
+def catmull_clark_refine(mesh, region):
+    """Builds the Catmull-Clark subdivision operator for one level.
+
+    The refined vertices are numbered so that the old vertices come first, followed by one edge
+    point per split edge and one face point per refined face. Faces next to the refined region keep
+    their shape, with the new edge points inserted as extra corners.
+
+    :param mesh: HalfEdgeMesh to refine.
+    :param region: Boolean mask of the faces to refine.
+    :return: Sparse subdivision operator, the corners, face sizes, and creases of the refined mesh,
+        and the mask of the faces that came out of the refined region.
+    """
+    num_vertices, num_faces = mesh.num_vertices, mesh.num_faces
+    h_face, h_edge, h_origin, h_target = mesh.face, mesh.edge, mesh.origin, mesh.target
+    edge_points = mesh.edge_points(region)
+    num_points = num_vertices + np.count_nonzero(edge_points >= 0)
+    refined = np.flatnonzero(region)
+
+    # Face points are the average of the face corners.
+    face_points = sparse.csr_matrix(
+        (1.0 / mesh.face_sizes[h_face], (h_face, h_origin)),
+        shape=(num_faces, num_vertices), dtype='float32')
+
+    # Edge and vertex points are written in terms of the old vertices followed by the face points.
+    rows, cols, weights = mesh.sharp_edge_rule(edge_points)
+
+    # Smooth edges average their endpoints and the face points on either side.
+    smooth = (edge_points[h_edge] >= 0) & ~mesh.sharp[h_edge]
+    edge_rows = edge_points[h_edge[smooth]]
+    rows += [edge_rows, edge_rows]
+    cols += [h_origin[smooth], num_vertices + h_face[smooth]]
+    weights += [np.full(len(edge_rows), 0.25)] * 2
+
+    # Smooth vertices with valence n: (n - 2) / n of the old vertex, plus 1 / n^2 of every
+    # neighbour and adjacent face point.
+    smooth_vertex, vertex_rows, vertex_cols, vertex_weights = mesh.vertex_rule(region)
+    valence = mesh.vertex_valence.astype('float64')
+    moved = smooth_vertex[h_origin]
+    share = 1.0 / valence[h_origin[moved]] ** 2
+    rows += vertex_rows + [h_origin[moved], h_origin[moved], np.flatnonzero(smooth_vertex)]
+    cols += vertex_cols + [h_target[moved], num_vertices + h_face[moved],
+                           np.flatnonzero(smooth_vertex)]
+    weights += vertex_weights + [share, share,
+                                 (valence[smooth_vertex] - 2) / valence[smooth_vertex]]
+
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    points = sparse.csr_matrix((weights, (rows, cols)),
+                               shape=(num_points, num_vertices + num_faces), dtype='float32')
+    points = points @ sparse.vstack((sparse.identity(num_vertices, dtype='float32', format='csr'),
+                                     face_points), format='csr')
+    operator = sparse.vstack((points, face_points[refined]), format='csr')
+
+    # Every half-edge of a refined face turns into the quad at its origin corner.
+    face_index = np.zeros(num_faces, dtype=np.int64)
+    face_index[refined] = num_points + np.arange(len(refined))
+    inside = np.flatnonzero(region[h_face])
+    quads = np.stack((h_origin[inside], edge_points[h_edge[inside]], face_index[h_face[inside]],
+                      edge_points[h_edge[mesh.prev[inside]]]), axis=1)
+    transition_corners, transition_sizes = mesh.transition_faces(region, edge_points)
+    corners = np.concatenate((quads.ravel(), transition_corners))
+    sizes = np.concatenate((np.full(len(quads), 4), transition_sizes))
+    return (operator, corners, sizes, mesh.child_creases(edge_points),
+            np.arange(len(sizes)) < len(quads))
+
+
+def catmull_clark_surface(vertices, faces, iterations=1, creases=None, region=None,
+                          feature_rings=None):
+    """Catmull-Clark subdivision surface wrapper function.
+
+    Applies several levels of Catmull-Clark subdivision to a polygon mesh. The operators for each
+    level are cached by mesh connectivity, so meshes that share their faces reuse them.
+
+    Refinement can be limited to part of the mesh, either with a region of faces or to the faces
+    within feature_rings rings of a crease or an extraordinary vertex. The faces around the refined
+    part become polygons that include the new edge points, so the mesh stays free of T-junctions.
+
+    :param vertices: List of vertices. Each vertex is also structured as a list: [x, y, z].
+    :param faces: Faces of the mesh. Either a 2D integer array with one row per face, or a list of
+        vertex index lists.
+    :param iterations: Optional. Number of subdivision levels.
+    :param creases: Optional. Array of vertex index pairs for the edges that should stay sharp.
+    :param region: Optional. Boolean mask of the faces to refine.
+    :param feature_rings: Optional. Only refine the faces within this many rings of the features.
+    :return: Vertices and faces of the subdivided mesh. The faces are a 2D array if they all have
+        the same number of corners, otherwise a list of index arrays.
+    """
+    return subdivide(catmull_clark_refine, vertices, faces, iterations, creases, region,
+                     feature_rings, regular_valence=4)
@@ -0,0 +1,402 @@
+"""Array-backed half-edge mesh.
+
+Subdivision surface schemes need to know, for every vertex, edge, and face, which other elements
+surround it. Storing that connectivity as Python objects quickly runs out of memory for large
+meshes, so this module keeps it in flat NumPy integer arrays instead. Every face is split into
+half-edges, one per corner, and all per-element lookups are answered with vectorized array
+operations.
+
+Faces are given either as a 2D integer array, when all faces have the same number of corners, or as
+a list of vertex index lists for mixed polygons. Sharp edges can be tagged as creases. Boundary
+edges are always treated as sharp.
+
+Subdivision can be limited to a region of faces. Only the edges of those faces are split, and the
+neighbouring faces become transition faces that share the new edge points, so the refined mesh has
+no T-junctions. The rules that do not depend on the scheme, such as the crease rules and the
+transition faces, are shared here.
+
+"""
+from collections import OrderedDict
+from hashlib import blake2b
+
+import numpy as np
+
+# Number of subdivision levels kept in the operator cache.
+CACHE_SIZE = 16
+# Levels whose refined mesh has more faces than this are not cached, so very large meshes do not
+# stay in memory after they are subdivided.
+CACHE_MAX_FACES = 1 << 20
+
+_level_cache = OrderedDict()
+
+
+def index_dtype(count):
+    """Picks the smallest integer type that can index the given number of elements.
+
+    :param count: Number of elements that need to be indexed.
+    :return: NumPy integer type.
+    """
+    if count < np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+class HalfEdgeMesh:
+    """Half-edge connectivity of a polygon mesh.
+
+    Half-edge h belongs to face `face[h]` and runs from vertex `origin[h]` to vertex `target[h]`.
+    The half-edges of a face are stored consecutively, so `next` and `prev` only wrap around at the
+    end of each face. Each half-edge also refers to the undirected edge it lies on through
+    `edge[h]`. The undirected edges are listed in `edges` as sorted vertex pairs.
+    """
+
+    def __init__(self, faces, num_vertices=None, creases=None, face_sizes=None):
+        """Builds the half-edge arrays for a mesh.
+
+        :param faces: Faces of the mesh. Either a 2D integer array with one row per face, or a list
+            of vertex index lists. If face_sizes is given, a flat array of all face corners.
+        :param num_vertices: Optional. Number of vertices. Defaults to the largest index plus one.
+        :param creases: Optional. Array of vertex index pairs for the edges that should stay sharp.
+        :param face_sizes: Optional. Number of corners of each face when faces is flat.
+        :return: None.
+        """
+        if face_sizes is not None:
+            sizes = np.asarray(face_sizes)
+            corners = np.asarray(faces)
+        elif isinstance(faces, np.ndarray) and faces.ndim == 2:
+            sizes = np.full(len(faces), faces.shape[1])
+            corners = faces.ravel()
+        else:
+            sizes = np.array([len(face) for face in faces], dtype=int)
+            corners = np.concatenate([np.asarray(face) for face in faces]) if len(faces) else []
+        if len(sizes) == 0:
+            raise Exception('Invalid mesh provided. The mesh has no faces.')
+        if np.any(sizes < 3):
+            raise Exception('Invalid mesh provided. Every face needs at least three vertices.')
+        if num_vertices is None:
+            num_vertices = int(np.max(corners)) + 1
+        if np.min(corners) < 0 or np.max(corners) >= num_vertices:
+            raise Exception('Invalid mesh provided. Face indices have to refer to existing '
+                            'vertices.')
+        dtype = index_dtype(max(num_vertices, len(corners)))
+
+        self.num_vertices = num_vertices
+        self.num_faces = len(sizes)
+        self.face_sizes = sizes.astype(dtype)
+        self.face_offsets = np.zeros(self.num_faces + 1, dtype=dtype)
+        np.cumsum(self.face_sizes, out=self.face_offsets[1:])
+
+        half_edges = np.arange(len(corners), dtype=dtype)
+        self.face = np.repeat(np.arange(self.num_faces, dtype=dtype), self.face_sizes)
+        self.next = half_edges + 1
+        self.next[self.face_offsets[1:] - 1] = self.face_offsets[:-1]
+        self.prev = half_edges - 1
+        self.prev[self.face_offsets[:-1]] = self.face_offsets[1:] - 1
+        self.origin = np.asarray(corners, dtype=dtype)
+        self.target = self.origin[self.next]
+
+        # Undirected edges are identified by their sorted vertex pair, packed into a single key.
+        self._edge_keys, edge = np.unique(self.pack(self.origin, self.target), return_inverse=True)
+        self.edge = edge.astype(dtype)
+        self.edges = np.stack(np.divmod(self._edge_keys, num_vertices), axis=1).astype(dtype)
+        self.num_edges = len(self.edges)
+
+        self.edge_valence = np.bincount(self.edge, minlength=self.num_edges)
+        if np.any(self.edge_valence > 2):
+            raise Exception('Invalid mesh provided. Non-manifold edges are not supported.')
+        self.boundary = self.edge_valence == 1
+        self.sharp = self.boundary.copy()
+        if creases is not None and len(creases):
+            self.sharp[self.find_edges(creases)] = True
+
+        self.vertex_valence = np.bincount(self.edges.ravel(), minlength=num_vertices)
+        self.vertex_sharpness = np.bincount(self.edges[self.sharp].ravel(), minlength=num_vertices)
+
+    def pack(self, first, second):
+        """Packs vertex pairs into a single integer key that ignores the order within the pair.
+
+        :param first: First vertex of each pair.
+        :param second: Second vertex of each pair.
+        :return: Key for each pair.
+        """
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        return np.minimum(first, second) * self.num_vertices + np.maximum(first, second)
+
+    def find_edges(self, pairs):
+        """Looks up the edge ids for a list of vertex pairs.
+
+        :param pairs: Array of vertex index pairs. The order within a pair does not matter.
+        :return: Edge id for each pair.
+        """
+        pairs = np.asarray(pairs).reshape(-1, 2)
+        if np.min(pairs) < 0 or np.max(pairs) >= self.num_vertices:
+            raise Exception('Invalid creases provided. Crease indices have to refer to existing '
+                            'vertices.')
+        wanted = self.pack(pairs[:, 0], pairs[:, 1])
+        found = np.minimum(np.searchsorted(self._edge_keys, wanted), self.num_edges - 1)
+        if np.any(self._edge_keys[found] != wanted):
+            raise Exception('Invalid creases provided. Every crease has to be an edge of the mesh.')
+        return found
+
+    def extraordinary_vertices(self, regular_valence):
+        """Finds the interior vertices whose valence differs from the regular valence of a scheme.
+
+        :param regular_valence: Valence of a regular interior vertex, 4 for quads and 6 for
+            triangles.
+        :return: Boolean mask over the vertices.
+        """
+        on_boundary = np.bincount(self.edges[self.boundary].ravel(),
+                                  minlength=self.num_vertices) > 0
+        return ~on_boundary & (self.vertex_valence > 0) & (self.vertex_valence != regular_valence)
+
+    def edge_points(self, region):
+        """Numbers the edge points that a refinement of the given faces creates.
+
+        Every edge of a refined face is split. Edge points are numbered after the old vertices.
+
+        :param region: Boolean mask of the faces to refine.
+        :return: Index of the edge point of every edge, or -1 if the edge is not split.
+        """
+        split = np.zeros(self.num_edges, dtype=bool)
+        split[self.edge[region[self.face]]] = True
+        points = np.full(self.num_edges, -1, dtype=np.int64)
+        points[split] = self.num_vertices + np.arange(np.count_nonzero(split))
+        return points
+
+    def sharp_edge_rule(self, edge_points):
+        """Stencils for the edge points on sharp edges, which are the edge midpoints.
+
+        :param edge_points: Index of the edge point of every edge, or -1 if the edge is not split.
+        :return: Lists of row, column, and weight arrays.
+        """
+        ids = np.flatnonzero(self.sharp & (edge_points >= 0))
+        half = np.full(len(ids), 0.5)
+        return [edge_points[ids]] * 2, [self.edges[ids, 0], self.edges[ids, 1]], [half, half]
+
+    def vertex_rule(self, region):
+        """Splits the old vertices into smooth ones and ones that follow a fixed rule.
+
+        Only vertices whose faces are all refined are moved. Vertices on exactly two sharp edges
+        follow the curve rule along those edges. Corners, with more than two sharp edges, and the
+        vertices that are not moved stay in place. The smooth vertices are left to the scheme.
+
+        :param region: Boolean mask of the faces to refine.
+        :return: Boolean mask of the smooth vertices, and lists of row, column, and weight arrays
+            for all other vertices.
+        """
+        moved = self.vertex_valence > 0
+        moved[self.origin[~region[self.face]]] = False
+        corner = self.vertex_sharpness > 2
+        crease = moved & (self.vertex_sharpness == 2)
+        smooth = moved & ~corner & ~crease
+
+        sharp_edges = self.edges[self.sharp]
+        vertex = np.concatenate((sharp_edges[:, 0], sharp_edges[:, 1]))
+        neighbour = np.concatenate((sharp_edges[:, 1], sharp_edges[:, 0]))
+        on_crease = crease[vertex]
+        fixed = np.flatnonzero(~smooth)
+        rows = [vertex[on_crease], fixed]
+        cols = [neighbour[on_crease], fixed]
+        weights = [np.full(np.count_nonzero(on_crease), 0.125), np.where(crease[fixed], 0.75, 1.0)]
+        return smooth, rows, cols, weights
+
+    def transition_faces(self, region, edge_points):
+        """Builds the faces outside the refined region.
+
+        The edge points on the split edges of these faces are inserted as extra corners, so they
+        connect to the refined faces without T-junctions. Faces without split edges are unchanged.
+
+        :param region: Boolean mask of the refined faces.
+        :param edge_points: Index of the edge point of every edge, or -1 if the edge is not split.
+        :return: Flat corner array and face size array of the transition faces.
+        """
+        kept = np.flatnonzero(~region[self.face])
+        points = edge_points[self.edge[kept]]
+        corners = np.stack((self.origin[kept], points), axis=1)
+        keep = np.stack((np.ones(len(kept), dtype=bool), points >= 0), axis=1)
+        inserted = np.bincount(self.face[kept], weights=points >= 0, minlength=self.num_faces)
+        sizes = self.face_sizes[~region] + inserted[~region].astype(self.face_sizes.dtype)
+        return corners[keep], sizes
+
+    def child_creases(self, edge_points):
+        """Carries the interior creases over to the next subdivision level.
+
+        Split creases become the two crease edges on either side of their edge point. Boundary
+        edges do not need to be carried over since they stay on the boundary after refinement.
+
+        :param edge_points: Index of the edge point of every edge, or -1 if the edge is not split.
+        :return: Array of vertex index pairs for the creases of the refined mesh.
+        """
+        ids = np.flatnonzero(self.sharp & ~self.boundary)
+        mid = edge_points[ids]
+        ends = self.edges[ids].astype(np.int64)
+        split = mid >= 0
+        return np.concatenate((np.stack((ends[split, 0], mid[split]), axis=1),
+                               np.stack((mid[split], ends[split, 1]), axis=1),
+                               ends[~split]))
+
+
+def flatten_faces(faces):
+    """Splits faces into a flat array of corners and the number of corners of each face.
+
+    :param faces: Faces of the mesh. Either a 2D integer array with one row per face, or a list of
+        vertex index lists.
+    :return: Flat corner array and face size array.
+    """
+    if len(faces) == 0:
+        raise Exception('Invalid mesh provided. The mesh has no faces.')
+    if isinstance(faces, np.ndarray) and faces.ndim == 2:
+        return faces.ravel(), np.full(len(faces), faces.shape[1], dtype=index_dtype(faces.size))
+    sizes = np.array([len(face) for face in faces], dtype=np.int64)
+    return np.concatenate([np.asarray(face, dtype=np.int64) for face in faces]), sizes
+
+
+def unflatten_faces(corners, sizes):
+    """Turns a flat corner array back into faces.
+
+    :param corners: Flat array of all face corners.
+    :param sizes: Number of corners of each face.
+    :return: 2D integer array if all faces have the same size, otherwise a list of index arrays.
+    """
+    if np.all(sizes == sizes[0]):
+        return corners.reshape(-1, sizes[0])
+    return np.split(corners, np.cumsum(sizes)[:-1])
+
+
+def feature_region(corners, sizes, features, rings=1):
+    """Selects the faces within a number of rings around feature vertices.
+
+    :param corners: Flat array of all face corners.
+    :param sizes: Number of corners of each face.
+    :param features: Boolean mask of the feature vertices.
+    :param rings: Optional. Number of face rings around the features to select.
+    :return: Boolean mask of the selected faces.
+    """
+    face = np.repeat(np.arange(len(sizes)), sizes)
+    near = features
+    region = np.zeros(len(sizes), dtype=bool)
+    for _ in range(rings):
+        region = np.bincount(face, weights=near[corners], minlength=len(sizes)) > 0
+        near = np.zeros(len(features), dtype=bool)
+        near[corners[region[face]]] = True
+    return region
+
+
+def topology_key(corners, sizes, num_vertices, creases, region):
+    """Computes a digest of the connectivity of a mesh.
+
+    Subdivision operators only depend on the connectivity of the mesh and the refined region, not on
+    the vertex positions, so the key is used to cache them across meshes that share the same faces.
+    Only the digest is kept, so the key stays small even for very large meshes.
+
+    :param corners: Flat array of all face corners.
+    :param sizes: Number of corners of each face.
+    :param num_vertices: Number of vertices.
+    :param creases: Array of vertex index pairs for the edges that should stay sharp.
+    :param region: Boolean mask of the faces to refine.
+    :return: Hashable key.
+    """
+    digest = blake2b(digest_size=20)
+    for array in (corners, sizes, creases, region):
+        array = np.ascontiguousarray(array)
+        digest.update('{}{}'.format(array.dtype.str, array.shape).encode())
+        digest.update(array)
+    return num_vertices, digest.hexdigest()
+
+
+def clear_cache():
+    """Removes all cached subdivision operators.
+
+    :return: None.
+    """
+    _level_cache.clear()
+
+
+def subdivision_level(refine, corners, sizes, num_vertices, creases, region, key):
+    """Cached single level of a subdivision scheme.
+
+    :param refine: Function that takes a HalfEdgeMesh and a region, and returns the sparse
+        subdivision operator, the corners, sizes, and creases of the refined mesh, and the region
+        of the refined mesh that lies inside the refined faces.
+    :param corners: Flat array of all face corners.
+    :param sizes: Number of corners of each face.
+    :param num_vertices: Number of vertices.
+    :param creases: Array of vertex index pairs for the edges that should stay sharp.
+    :param region: Boolean mask of the faces to refine.
+    :param key: Key of the mesh to refine, as produced by topology_key.
+    :return: Sparse subdivision operator, and corners, sizes, creases, and region of the refined
+        mesh.
+    """
+    cached = _level_cache.get((refine, key))
+    if cached is not None:
+        _level_cache.move_to_end((refine, key))
+        return cached
+    mesh = HalfEdgeMesh(corners, num_vertices, creases, face_sizes=sizes)
+    level = refine(mesh, region)
+    # The arrays are shared between every caller that hits the cache.
+    for array in level[1:]:
+        array.setflags(write=False)
+    if len(level[2]) <= CACHE_MAX_FACES and CACHE_SIZE > 0:
+        _level_cache[(refine, key)] = level
+        while len(_level_cache) > CACHE_SIZE:
+            _level_cache.popitem(last=False)
+    return level
+
+
+def subdivide(refine, vertices, faces, iterations=1, creases=None, region=None,
+              feature_rings=None, regular_valence=None):
+    """Applies a subdivision scheme to a mesh.
+
+    Each level is applied as a single sparse matrix product. The operators are cached by mesh
+    connectivity, so subdividing many meshes that share the same faces only builds them once. The
+    size of the cache is controlled by CACHE_SIZE and CACHE_MAX_FACES.
+
+    By default every face is refined. Passing a region only refines those faces, and on later levels
+    the faces that came out of them. Passing feature_rings instead refines, on every level, only the
+    faces within that many rings of a crease or an extraordinary vertex of the original mesh, so the
+    face count grows around the features instead of over the whole mesh.
+
+    :param refine: Function that refines a single level, see subdivision_level.
+    :param vertices: List of vertices. Each vertex is also structured as a list: [x, y, z].
+    :param faces: Faces of the mesh. Either a 2D integer array with one row per face, or a list of
+        vertex index lists.
+    :param iterations: Optional. Number of subdivision levels.
+    :param creases: Optional. Array of vertex index pairs for the edges that should stay sharp.
+    :param region: Optional. Boolean mask of the faces to refine.
+    :param feature_rings: Optional. Number of face rings around the features to refine.
+    :param regular_valence: Optional. Valence of a regular interior vertex of the scheme. Needed
+        with feature_rings.
+    :return: Vertices and faces of the refined mesh.
+    """
+    if region is not None and feature_rings is not None:
+        raise Exception('Invalid options provided. Use either a region or feature rings.')
+    vertices = np.array(vertices, dtype='float32')
+    corners, sizes = flatten_faces(faces)
+    if creases is None:
+        creases = np.zeros((0, 2), dtype=np.int64)
+    creases = np.asarray(creases, dtype=np.int64).reshape(-1, 2)
+    if region is not None:
+        region = np.asarray(region, dtype=bool)
+        if region.shape != sizes.shape:
+            raise Exception('Invalid region provided. The region needs one value per face.')
+    features = None
+    if feature_rings is not None:
+        mesh = HalfEdgeMesh(corners, len(vertices), creases, face_sizes=sizes)
+        features = mesh.extraordinary_vertices(regular_valence)
+
+    for _ in range(iterations):
+        if features is not None:
+            # Old vertices keep their index, so the original features can be padded with the new
+            # vertices, none of which are extraordinary. Creases are followed on every level.
+            current = np.zeros(len(vertices), dtype=bool)
+            current[:len(features)] = features
+            current[creases.ravel()] = True
+            region = feature_region(corners, sizes, current, feature_rings)
+        elif region is None:
+            region = np.ones(len(sizes), dtype=bool)
+        key = topology_key(corners, sizes, len(vertices), creases, region)
+        operator, corners, sizes, creases, region = subdivision_level(
+            refine, corners, sizes, len(vertices), creases, region, key)
+        vertices = operator @ vertices
+    return vertices, unflatten_faces(corners, sizes)
@@ -0,0 +1,146 @@
+"""Computes Loop subdivision surfaces.
+
+Loop subdivision works on triangle meshes. Every level adds a point on each edge, moves the original
+vertices, and splits every triangle into four. In the limit, the surface is a quartic box spline
+surface everywhere except around extraordinary vertices, which are vertices with a valence other
+than six.
+
+Like Catmull-Clark subdivision, each level is a sparse matrix that only depends on the connectivity
+of the mesh. Sharp edges follow the cubic B-spline curve rule, so boundaries and creases stay sharp.
+Refinement can also be limited to part of the mesh, so the face count only grows where the detail
+is needed.
+
+"""
+from math import cos, pi
+
+from scipy import sparse
+
+import numpy as np
+
+from surfaces.halfedge import subdivide
+
+
+def loop_weight(valence):
+    """Computes the weight of each neighbour when moving a smooth vertex.
+
+    Uses Loop's original choice of weights, which keeps the limit surface smooth around
+    extraordinary vertices.
+
+    :param valence: Number of edges around the vertex.
+    :return: Weight of each neighbouring vertex.
+    """
+    return (0.625 - (0.375 + 0.25 * cos(2.0 * pi / valence)) ** 2) / valence
+
+
+def loop_closure(mesh, region):
+    """Grows a region until every triangle outside it has at most one split edge.
+
+    A triangle with one split edge can be bisected through the edge point. Triangles with two or
+    three split edges are refined as well.
+
+    :param mesh: HalfEdgeMesh to refine.
+    :param region: Boolean mask of the faces to refine.
+    :return: Boolean mask of the faces to refine.
+    """
+    region = region.copy()
+    while True:
+        split = mesh.edge_points(region)[mesh.edge] >= 0
+        count = np.bincount(mesh.face, weights=split, minlength=mesh.num_faces)
+        grow = ~region & (count >= 2)
+        if not np.any(grow):
+            return region
+        region |= grow
+
+
+def loop_refine(mesh, region):
+    """Builds the Loop subdivision operator for one level.
+
+    The refined vertices are numbered so that the old vertices come first, followed by one edge
+    point per split edge. Triangles next to the refined region are bisected through their edge
+    point.
+
+    :param mesh: HalfEdgeMesh to refine. All faces have to be triangles.
+    :param region: Boolean mask of the faces to refine.
+    :return: Sparse subdivision operator, the corners, face sizes, and creases of the refined mesh,
+        and the mask of the faces that came out of the refined region.
+    """
+    if np.any(mesh.face_sizes != 3):
+        raise Exception('Invalid mesh provided. Loop subdivision only supports triangles.')
+    num_vertices = mesh.num_vertices
+    h_edge, h_origin, h_target = mesh.edge, mesh.origin, mesh.target
+    region = loop_closure(mesh, region)
+    edge_points = mesh.edge_points(region)
+    num_points = num_vertices + np.count_nonzero(edge_points >= 0)
+    rows, cols, weights = mesh.sharp_edge_rule(edge_points)
+
+    # Smooth edges take 3/8 of their endpoints and 1/8 of the opposite vertices.
+    smooth = (edge_points[h_edge] >= 0) & ~mesh.sharp[h_edge]
+    edge_rows = edge_points[h_edge[smooth]]
+    opposite = h_target[mesh.next]
+    rows += [edge_rows, edge_rows]
+    cols += [h_origin[smooth], opposite[smooth]]
+    weights += [np.full(len(edge_rows), 0.375), np.full(len(edge_rows), 0.125)]
+
+    # Smooth vertices keep 1 - n * beta of themselves and take beta of every neighbour.
+    smooth_vertex, vertex_rows, vertex_cols, vertex_weights = mesh.vertex_rule(region)
+    valence = mesh.vertex_valence
+    beta = np.zeros(num_vertices)
+    for n in np.unique(valence[smooth_vertex]):
+        beta[valence == n] = loop_weight(n)
+    moved = smooth_vertex[h_origin]
+    rows += vertex_rows + [h_origin[moved], np.flatnonzero(smooth_vertex)]
+    cols += vertex_cols + [h_target[moved], np.flatnonzero(smooth_vertex)]
+    weights += vertex_weights + [beta[h_origin[moved]], 1.0 - (valence * beta)[smooth_vertex]]
+
+    rows, cols, weights = np.concatenate(rows), np.concatenate(cols), np.concatenate(weights)
+    operator = sparse.csr_matrix((weights, (rows, cols)),
+                                 shape=(num_points, num_vertices), dtype='float32')
+
+    # Each refined triangle is split into three corner triangles and one in the middle.
+    triangles = h_origin.reshape(-1, 3).astype(np.int64)
+    mids = edge_points[h_edge].reshape(-1, 3)
+    corners, middle = triangles[region], mids[region]
+    refined = np.concatenate((
+        np.stack((corners[:, 0], middle[:, 0], middle[:, 2]), axis=1),
+        np.stack((corners[:, 1], middle[:, 1], middle[:, 0]), axis=1),
+        np.stack((corners[:, 2], middle[:, 2], middle[:, 1]), axis=1),
+        middle,
+    ))
+
+    # Triangles with one split edge are bisected from the edge point to the opposite corner.
+    bisect = ~region & np.any(mids >= 0, axis=1)
+    first = np.argmax(mids[bisect] >= 0, axis=1)
+    order = (first[:, None] + np.arange(3)) % 3
+    corners = np.take_along_axis(triangles[bisect], order, axis=1)
+    middle = mids[bisect, first]
+    transition = np.concatenate((
+        np.stack((corners[:, 0], middle, corners[:, 2]), axis=1),
+        np.stack((middle, corners[:, 1], corners[:, 2]), axis=1),
+        triangles[~region & ~bisect],
+    ))
+
+    faces = np.concatenate((refined, transition))
+    return (operator, faces.ravel(), np.full(len(faces), 3), mesh.child_creases(edge_points),
+            np.arange(len(faces)) < len(refined))
+
+
+def loop_surface(vertices, faces, iterations=1, creases=None, region=None, feature_rings=None):
+    """Loop subdivision surface wrapper function.
+
+    Applies several levels of Loop subdivision to a triangle mesh. The operators for each level are
+    cached by mesh connectivity, so meshes that share their faces reuse them.
+
+    Refinement can be limited to part of the mesh, either with a region of faces or to the faces
+    within feature_rings rings of a crease or an extraordinary vertex. The triangles around the
+    refined part are bisected, so the mesh stays free of T-junctions.
+
+    :param vertices: List of vertices. Each vertex is also structured as a list: [x, y, z].
+    :param faces: Triangles of the mesh, either as a 2D integer array or a list of index lists.
+    :param iterations: Optional. Number of subdivision levels.
+    :param creases: Optional. Array of vertex index pairs for the edges that should stay sharp.
+    :param region: Optional. Boolean mask of the faces to refine.
+    :param feature_rings: Optional. Only refine the faces within this many rings of the features.
+    :return: Vertices and triangle faces of the subdivided mesh.
+    """
+    return subdivide(loop_refine, vertices, faces, iterations, creases, region, feature_rings,
+                     regular_valence=6)
@@ -0,0 +1,350 @@
+"""Command line tessellator for large batches of curves.
+
+Reads control data for many curves from NumPy files, evaluates every curve with one of the curve
+modules, and streams the resulting points into a memory-mapped output file. This avoids holding
+either the input or the output in memory, so it works for batches much larger than RAM.
+
+The input is either a directory of .npy files or a single .npz file with the same arrays. Both are
+memory-mapped, as long as the .npz file was written without compression by np.savez. The arrays in
+a compressed .npz file, from np.savez_compressed, have to be loaded into memory. Curves are stored
+back to back in a ragged layout:
+
+* points.npy: All control points, with shape (total points, dimensions).
+* offsets.npy: Start of each curve in points, followed by the total number of points.
+* weights.npy: Optional. Weight of each control point, used by NURBS.
+* derivatives.npy: Optional. Derivatives of each control point, with shape
+  (total points, order, dimensions), used by the Hermite methods.
+* knots.npy and knot_offsets.npy: Optional. Knots of all curves and the start of each curve in
+  knots, followed by the total number of knots. B-spline and NURBS curves need n + degree - 1 knots
+  for n control points, Catmull-Rom splines need n + 2 since the curve is padded at both ends, and
+  Lagrange interpolation uses n knots as its nodes.
+
+The output directory gets points.npy and offsets.npy in the same layout, plus progress.npy, which
+records how many curves are finished, and settings.json, which records the input and options of the
+run. An interrupted run can be picked up again with --resume, as long as the input and options are
+the same.
+
+    python tessellate.py control_data/ curves_out/ --method bspline --degree 3
+
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zipfile
+
+import numpy as np
+
+from curves.bspline import bspline_curve
+from curves.catmull_rom import catmull_rom_curve
+from curves.four_point_subdivision import four_point_operator
+from curves.hermite import hermite_curve, hermite_spline_curve
+from curves.lagrange import lagrange_curve
+from curves.nurbs import nurbs
+
+METHODS = ['bspline', 'catmull-rom', 'four-point', 'hermite', 'hermite-spline', 'lagrange',
+           'nurbs']
+ARRAYS = ['points', 'offsets', 'weights', 'derivatives', 'knots', 'knot_offsets']
+
+
+def open_npz_member(path, archive, info):
+    """Memory-maps a single array inside a .npz file.
+
+    Arrays that are stored without compression sit in the .npz file as regular .npy data, so they
+    can be mapped at their offset in the file. Compressed arrays are read into memory instead.
+
+    :param path: Path of the .npz file.
+    :param archive: Open zipfile.ZipFile of the .npz file.
+    :param info: ZipInfo of the array.
+    :return: Array.
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as member:
+            return np.lib.format.read_array(member)
+    with open(path, 'rb') as npz_file:
+        # The data follows the 30 byte local header, the file name, and the extra field.
+        npz_file.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', npz_file.read(4))
+        npz_file.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(npz_file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npz_file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npz_file)
+        offset = npz_file.tell()
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def load_control_data(path):
+    """Loads the control data arrays, memory-mapping them where possible.
+
+    :param path: Directory of .npy files or a single .npz file.
+    :return: Dictionary of the arrays that were found.
+    """
+    if os.path.isdir(path):
+        return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                for name in ARRAYS if os.path.exists(os.path.join(path, name + '.npy'))}
+    with zipfile.ZipFile(path) as archive:
+        members = {info.filename: info for info in archive.infolist()}
+        return {name: open_npz_member(path, archive, members[name + '.npy'])
+                for name in ARRAYS if name + '.npy' in members}
+
+
+def output_size(method, num_points, args):
+    """Computes how many points a curve produces.
+
+    :param method: Name of the curve method.
+    :param num_points: Number of control points of the curve.
+    :param args: Parsed command line arguments.
+    :return: Number of points on the tessellated curve.
+    """
+    if method == 'four-point':
+        # Every level turns n points into 2n - 3, starting from the n + 2 padded points.
+        return (2 ** args.iterations) * (num_points - 1) + 3
+    return args.samples * num_points
+
+
+def sample_range(start, end, count, endpoint=True):
+    """Evenly spaced parameter values as a list, since the curve modules expect lists.
+
+    :param start: First parameter value.
+    :param end: Last parameter value.
+    :param count: Number of parameter values.
+    :param endpoint: Optional. Whether to include the last parameter value.
+    :return: List of parameter values.
+    """
+    if endpoint:
+        return list(np.linspace(start, end, count))
+    return list(np.linspace(start, end, count + 1)[:-1])
+
+
+def tessellate_curve(method, data, index, args):
+    """Evaluates a single curve.
+
+    :param method: Name of the curve method.
+    :param data: Dictionary of control data arrays.
+    :param index: Index of the curve.
+    :param args: Parsed command line arguments.
+    :return: Array of points on the curve.
+    """
+    start, end = data['offsets'][index], data['offsets'][index + 1]
+    points = np.array(data['points'][start:end], dtype='float32')
+    count = output_size(method, len(points), args)
+    knots = None
+    if 'knots' in data:
+        knots = data['knots'][data['knot_offsets'][index]:data['knot_offsets'][index + 1]].tolist()
+
+    if method == 'four-point':
+        operator = four_point_operator(len(points), args.iterations, args.weight)
+        return operator @ points
+    if method in ('hermite', 'hermite-spline'):
+        control = np.concatenate((points[:, None], data['derivatives'][start:end]), axis=1)
+        t_values = sample_range(0, len(points) - 1, count)
+        if method == 'hermite':
+            return hermite_curve(control.tolist(), t_values)
+        return hermite_spline_curve(control.tolist(), t_values)
+    if method == 'lagrange':
+        nodes = knots or list(range(0, len(points)))
+        return lagrange_curve(points.tolist(), sample_range(nodes[0], nodes[-1], count), nodes)
+    if method == 'catmull-rom':
+        # The module pads the curve with one extra point at each end.
+        t_range = (knots[1], knots[-2]) if knots else (1, len(points))
+        return catmull_rom_curve(points, sample_range(*t_range, count, endpoint=False), knots)
+
+    degree = args.degree
+    t_range = (knots[degree - 1], knots[len(points) - 1]) if knots else (0, len(points) - degree)
+    t_values = sample_range(*t_range, count, endpoint=False)
+    if method == 'bspline':
+        return bspline_curve(degree, points, t_values, knots)
+    return nurbs(degree, points, data['weights'][start:end], t_values, knots)
+
+
+def run_settings(args, data):
+    """Collects everything that determines the output of a run.
+
+    Only the options that the chosen method uses are recorded, so options that have no effect do
+    not have to be repeated when resuming.
+
+    :param args: Parsed command line arguments.
+    :param data: Dictionary of control data arrays.
+    :return: Dictionary of settings.
+    """
+    settings = {
+        'input': os.path.abspath(args.input),
+        'num_points': len(data['points']),
+        'method': args.method,
+    }
+    if args.method == 'four-point':
+        settings['iterations'] = args.iterations
+        settings['weight'] = args.weight
+    else:
+        settings['samples'] = args.samples
+    if args.method in ('bspline', 'nurbs'):
+        settings['degree'] = args.degree
+    return settings
+
+
+def open_output(path, offsets, dims, settings, resume):
+    """Creates the memory-mapped output files, or reopens them to resume a run.
+
+    :param path: Output directory.
+    :param offsets: Start of each tessellated curve, followed by the total number of points.
+    :param dims: Number of dimensions of each point.
+    :param settings: Settings of the run, as returned by run_settings.
+    :param resume: Whether to continue a previous run.
+    :return: Memory-mapped points and progress arrays.
+    """
+    points_path = os.path.join(path, 'points.npy')
+    progress_path = os.path.join(path, 'progress.npy')
+    offsets_path = os.path.join(path, 'offsets.npy')
+    settings_path = os.path.join(path, 'settings.json')
+    if resume and os.path.exists(progress_path):
+        if not os.path.exists(settings_path):
+            raise Exception('Cannot resume. The output has no recorded settings.')
+        with open(settings_path) as settings_file:
+            previous = json.load(settings_file)
+        if previous != settings or \
+                not np.array_equal(np.load(offsets_path, mmap_mode='r'), offsets):
+            raise Exception('Cannot resume. The output was written with different settings.')
+        return (np.lib.format.open_memmap(points_path, mode='r+'),
+                np.lib.format.open_memmap(progress_path, mode='r+'))
+    os.makedirs(path, exist_ok=True)
+    np.save(offsets_path, offsets)
+    with open(settings_path, 'w') as settings_file:
+        json.dump(settings, settings_file, indent=2)
+    points = np.lib.format.open_memmap(points_path, mode='w+', dtype='float32',
+                                       shape=(int(offsets[-1]), dims))
+    progress = np.lib.format.open_memmap(progress_path, mode='w+', dtype='int64', shape=(1,))
+    return points, progress
+
+
+def report(done, total, points, elapsed):
+    """Prints progress and throughput on a single line.
+
+    :param done: Number of finished curves.
+    :param total: Total number of curves.
+    :param points: Number of points written during this run.
+    :param elapsed: Seconds since the start of this run.
+    :return: None.
+    """
+    elapsed = max(elapsed, 1e-9)
+    sys.stderr.write('\r{}/{} curves, {:.1f} curves/s, {:.0f} points/s'.format(
+        done, total, done / elapsed, points / elapsed))
+    sys.stderr.flush()
+
+
+def minimum_points(args):
+    """Number of control points that each curve of the chosen method needs.
+
+    :param args: Parsed command line arguments.
+    :return: Minimum number of control points.
+    """
+    if args.method in ('bspline', 'nurbs'):
+        return args.degree + 1
+    if args.method == 'four-point':
+        return 4
+    if args.method in ('catmull-rom', 'lagrange'):
+        return 2
+    return 1
+
+
+def check_knots(args, data):
+    """Checks that every curve has the number of knots its method needs.
+
+    :param args: Parsed command line arguments.
+    :param data: Dictionary of control data arrays.
+    :return: None.
+    """
+    if 'knot_offsets' not in data:
+        raise Exception('Invalid input provided. knots need knot_offsets.')
+    if len(data['knot_offsets']) != len(data['offsets']):
+        raise Exception('Invalid input provided. knot_offsets needs one entry per curve plus one.')
+    num_points = np.diff(data['offsets'])
+    num_knots = np.diff(data['knot_offsets'])
+    if args.method in ('bspline', 'nurbs'):
+        expected = num_points + args.degree - 1
+        rule = 'n + degree - 1'
+    elif args.method == 'catmull-rom':
+        expected = num_points + 2
+        rule = 'n + 2'
+    elif args.method == 'lagrange':
+        expected = num_points
+        rule = 'n'
+    else:
+        return
+    if not np.array_equal(num_knots, expected):
+        raise Exception('Invalid input provided. {} curves need {} knots for n control points.'
+                        .format(args.method, rule))
+
+
+def tessellate(args):
+    """Tessellates every curve in the input and writes the results to the output directory.
+
+    :param args: Parsed command line arguments.
+    :return: None.
+    """
+    data = load_control_data(args.input)
+    if 'points' not in data or 'offsets' not in data:
+        raise Exception('Invalid input provided. points and offsets are required.')
+    if args.method == 'nurbs' and 'weights' not in data:
+        raise Exception('Invalid input provided. NURBS curves need weights.')
+    if args.method.startswith('hermite') and 'derivatives' not in data:
+        raise Exception('Invalid input provided. Hermite curves need derivatives.')
+    if np.any(np.diff(data['offsets']) < minimum_points(args)):
+        raise Exception('Invalid input provided. {} curves need at least {} control points.'
+                        .format(args.method, minimum_points(args)))
+    if 'knots' in data:
+        check_knots(args, data)
+
+    num_curves = len(data['offsets']) - 1
+    sizes = [output_size(args.method, int(n), args) for n in np.diff(data['offsets'])]
+    offsets = np.concatenate(([0], np.cumsum(sizes, dtype='int64')))
+    points, progress = open_output(args.output, offsets, data['points'].shape[1],
+                                   run_settings(args, data), args.resume)
+
+    first = int(progress[0])
+    written = 0
+    start_time = time.time()
+    for index in range(first, num_curves):
+        curve = tessellate_curve(args.method, data, index, args)
+        points[offsets[index]:offsets[index + 1]] = curve
+        written += len(curve)
+        done = index + 1
+        if done % args.chunk == 0 or done == num_curves:
+            # Flush the points before recording them as finished so a resume never skips curves.
+            points.flush()
+            progress[0] = done
+            progress.flush()
+            report(done - first, num_curves - first, written, time.time() - start_time)
+    sys.stderr.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tessellate a batch of curves.')
+    parser.add_argument('input', help='Directory of .npy files or a .npz file with control data.')
+    parser.add_argument('output', help='Directory for the tessellated curves.')
+    parser.add_argument('--method', choices=METHODS, default='bspline')
+    parser.add_argument('--degree', type=int, default=3,
+                        help='Degree of B-spline and NURBS curves.')
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='Number of samples per control point.')
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='Number of Four Point Subdivision levels.')
+    parser.add_argument('--weight', type=float, default=.0625,
+                        help='Four Point Subdivision weight parameter.')
+    parser.add_argument('--chunk', type=int, default=256,
+                        help='Number of curves between progress updates.')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run.')
+    args = parser.parse_args()
+    if args.samples < 1:
+        parser.error('--samples must be at least 1')
+    if args.chunk < 1:
+        parser.error('--chunk must be at least 1')
+    tessellate(args)
+
+
+if __name__ == '__main__':
+    main()